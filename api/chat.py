@@ -1,17 +1,50 @@
-from fastapi import Request
+import hashlib
+
+from fastapi import Request, Response
 from fastapi.responses import JSONResponse
-import requests
+import cachetools
+import httpx
 
 # Apunta al FastAPI local
 LOCAL_ROUTER = "http://127.0.0.1:8000"
 
+# Cliente compartido a nivel de módulo: pool de conexiones keep-alive,
+# sin handshake TCP por llamada y sin bloquear el event loop
+client = httpx.AsyncClient(
+    timeout=30.0,
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+)
+
+# Respuestas recientes por consulta: un acierto evita todo el pipeline LLM
+cache = cachetools.TTLCache(maxsize=4096, ttl=300)
+
+
+async def close():
+    """Cierra el pool; registrar en el shutdown de la app que monte chat()."""
+    await client.aclose()
+
+
 async def chat(request: Request):
     data = await request.json()
     query = data.get("query", "")
+    key = hashlib.blake2b(query.encode(), digest_size=16).digest()
+    cached = cache.get(key)
+    if cached is not None:
+        return Response(cached, media_type="application/json")
     try:
-        # Llamada a la ruta local
-        res = requests.post(f"{LOCAL_ROUTER}/route", json={"query": query}, timeout=60)
+        # Llamada a la ruta local; el cuerpo ya es JSON, así que se
+        # reenvían los bytes tal cual sin decodificar + re-serializar
+        res = await client.post(f"{LOCAL_ROUTER}/route", json={"query": query})
         res.raise_for_status()
-        return JSONResponse(res.json())
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+        body = res.content
+        cache[key] = body
+        return Response(body, media_type="application/json")
+    except httpx.TimeoutException:
+        return JSONResponse({"error": "timeout del enrutador local"},
+                            status_code=504)
+    except httpx.RequestError as e:
+        return JSONResponse({"error": f"enrutador local no disponible: {e}"},
+                            status_code=502)
+    except httpx.HTTPStatusError as e:
+        return JSONResponse({"error": str(e)},
+                            status_code=e.response.status_code)
@@ -1,14 +1,41 @@
+import os
+
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse, StreamingResponse
+from pydantic import BaseModel
 from hyperion.core_system import AlphaHyperionSystem
 import uvicorn
 
-app = FastAPI()
+# orjson serializa la respuesta varias veces más rápido que el json estándar
+app = FastAPI(default_response_class=ORJSONResponse)
 system = AlphaHyperionSystem()
 
+
+class RouteReq(BaseModel):
+    query: str
+
+
 @app.post("/route")
-def route(data: dict):
-    return system.route_query(data["query"])
+async def route(req: RouteReq):
+    return await system.route_query_async(req.query)
+
+
+@app.post("/route_stream")
+async def route_stream(req: RouteReq):
+    return StreamingResponse(system.route_query_stream(req.query),
+                             media_type="text/event-stream")
 
 if __name__ == "__main__":
     print("Hyperion Router en http://localhost:8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop + httptools y un worker por núcleo; sin access log, que cuesta
+    # throughput medible. El estado (clasificador/router) es por proceso:
+    # el enrutamiento es determinista a partir de la consulta.
+    uvicorn.run(
+        "api_local:app",
+        host="0.0.0.0",
+        port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=int(os.getenv("WORKERS", os.cpu_count() or 1)),
+        access_log=False,
+    )
@@ -0,0 +1,20 @@
+from .core_system import AlphaHyperionSystem, FastPatternClassifier
+from .expert_models import (
+    Expert,
+    ExpertFactory,
+    IntelligentRouter,
+    MetaAgent,
+    MonteCarloEngine,
+    Task,
+)
+
+__all__ = [
+    "AlphaHyperionSystem",
+    "FastPatternClassifier",
+    "Expert",
+    "ExpertFactory",
+    "IntelligentRouter",
+    "MetaAgent",
+    "MonteCarloEngine",
+    "Task",
+]
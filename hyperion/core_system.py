@@ -0,0 +1,864 @@
+"""Sistema central de Alpha Hyperion: clasificación y enrutamiento de consultas."""
+
+import asyncio
+import functools
+import pickle
+import re
+import sys
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from cachetools import LRUCache
+
+try:
+    import ollama
+    OLLAMA_AVAILABLE = True
+except ImportError:
+    OLLAMA_AVAILABLE = False
+
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    AHOCORASICK_AVAILABLE = False
+
+from .expert_models import (
+    DOMAINS,
+    ExpertFactory,
+    IntelligentRouter,
+    MetaAgent,
+    MonteCarloEngine,
+    Task,
+    _update_perf_jit,
+    njit,
+)
+
+
+@functools.lru_cache(maxsize=256)
+def _routing_reason(domains_tuple: tuple, num_experts: int,
+                    complexity_bucket: int) -> str:
+    """Texto de la razón de enrutamiento, memoizado por clase de equivalencia.
+
+    Las consultas colapsan en muy pocas combinaciones de (dominios, tamaño
+    de equipo, complejidad en cubos de 0.05), así que el caso común es un
+    get de dict en vez de construir f-strings.
+    """
+    if num_experts == 1:
+        expert_id = ExpertFactory.get_domain_mapping().get(
+            domains_tuple[0], 'experto por defecto')
+        return f"Dominio único '{domains_tuple[0]}' -> {expert_id}"
+    if complexity_bucket > 8:  # complejidad > 0.40
+        return (f"Consulta compleja (~{complexity_bucket / 20:.2f}) sobre "
+                f"{', '.join(domains_tuple)} -> equipo de {num_experts} expertos")
+    return (f"Multi-dominio {', '.join(domains_tuple)} -> "
+            f"colaboración de {num_experts} expertos")
+
+
+@njit(cache=True)
+def _task_params(complexity, n_domains):
+    """Parámetros derivados de la tarea en un único kernel escalar."""
+    if n_domains > 1:
+        interdependency = complexity * 1.1
+    else:
+        interdependency = complexity
+    return interdependency, complexity * 1.05
+
+
+@njit(cache=True, fastmath=True)
+def _score_experts(exp_arr, idx):
+    """Puntuación vectorizada: éxito * especialización * disponibilidad * frescura."""
+    return (exp_arr[idx, 0] * exp_arr[idx, 1] * exp_arr[idx, 2]
+            * (1.0 - exp_arr[idx, 3] / exp_arr[idx, 4]))
+
+
+class FastPatternClassifier:
+    """Clasifica consultas en dominios con un único barrido multi-palabra.
+
+    Todas las palabras clave (y los radicales que antes cubrían las regex de
+    alternación) se compilan una sola vez en __init__ en un autómata
+    Aho-Corasick, de modo que classify_fast hace una única pasada O(n) sobre
+    la consulta en vez de docenas de barridos independientes.
+    """
+
+    keyword_weights = {
+        'mathematics': {
+            'calcul': 0.9, 'cuánto': 0.8, 'cuanto': 0.8, 'ecuaci': 0.9,
+            'derivad': 0.9, 'integral': 0.9, 'matemátic': 0.8, 'suma': 0.7,
+            'resta': 0.7, 'multiplic': 0.7, 'divide': 0.7, 'porcentaje': 0.7,
+            'primo': 0.8, 'raíz': 0.8, 'teorema': 0.9, 'demuestra': 0.8,
+        },
+        'programming': {
+            'código': 0.9, 'codigo': 0.9, 'python': 0.9, 'función': 0.8,
+            'funcion': 0.8, 'programa': 0.8, 'script': 0.8, 'bug': 0.8,
+            'clase': 0.7, 'lista': 0.6, 'api': 0.7, 'algoritmo': 0.8,
+            'javascript': 0.9, 'sql': 0.9, 'compil': 0.8, 'debug': 0.9,
+        },
+        'language': {
+            'escribe': 0.8, 'redacta': 0.9, 'traduce': 0.9, 'resume': 0.8,
+            'poema': 0.9, 'cuento': 0.9, 'historia': 0.7, 'carta': 0.8,
+            'explica': 0.6, 'ensayo': 0.9, 'gramátic': 0.9, 'relato': 0.9,
+        },
+    }
+
+    complex_keywords = ('algoritmo', 'optimizar', 'avanzado', 'complejo', 'sistema')
+
+    creative_keywords = ('poema', 'cuento', 'relato', 'historia', 'inventa', 'imagina')
+    language_keywords = ('traduce', 'redacta', 'resume', 'gramática', 'ensayo', 'carta')
+    programming_keywords = ('código', 'python', 'función', 'script', 'debug', 'compilar')
+    mathematics_keywords = ('calcula', 'ecuación', 'derivada', 'integral', 'teorema', 'demuestra')
+
+    CACHE_MAX_ENTRIES = 10000
+
+    def __init__(self):
+        # LRU acotada: se reordena en cada acierto y expulsa el más antiguo
+        self.cache = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        # Un único autómata para todos los dominios: cada palabra emite
+        # (dominio, peso) al encontrarse durante la pasada.
+        # Los nombres solo se usan al formatear el resultado; el barrido
+        # acumula sobre índices enteros de dominio.
+        # Nombres interned: las listas de dominios que emite classify_fast
+        # comparten los mismos objetos str que los dicts del sistema
+        self._domain_names = tuple(sys.intern(d) for d in DOMAINS)
+        if AHOCORASICK_AVAILABLE:
+            automaton = ahocorasick.Automaton()
+            for domain, keywords in self.keyword_weights.items():
+                for keyword, weight in keywords.items():
+                    automaton.add_word(keyword, (DOMAINS[domain], weight))
+            automaton.make_automaton()
+            self._automaton = automaton
+            self._keyword_re = None
+        else:
+            # Fallback sin dependencia nativa: una única alternación compilada
+            # sigue siendo una sola pasada sobre la consulta.
+            self._automaton = None
+            self._kw_payload = {}
+            parts = []
+            for domain, keywords in self.keyword_weights.items():
+                for keyword, weight in keywords.items():
+                    self._kw_payload[keyword] = (DOMAINS[domain], weight)
+                    parts.append(re.escape(keyword))
+            parts.sort(key=len, reverse=True)
+            self._keyword_re = re.compile("|".join(parts))
+        # Expresión aritmética explícita (p. ej. "2 + 2")
+        self._math_expr_re = re.compile(r'\d+\s*[+\-*/^%]\s*\d+')
+        # Alternaciones precompiladas para la heurística de complejidad:
+        # una pasada en vez de un barrido por palabra clave
+        self._complex_kw_re = re.compile("|".join(self.complex_keywords))
+        self._creation_kw_re = re.compile("función|funcion|crear")
+        # Predicados de respaldo como alternaciones compiladas: una pasada
+        # por predicado en vez de un barrido por palabra clave
+        self._creative_re = re.compile("|".join(map(re.escape, self.creative_keywords)))
+        self._language_re = re.compile("|".join(map(re.escape, self.language_keywords)))
+        self._programming_re = re.compile("|".join(map(re.escape, self.programming_keywords)))
+        self._mathematics_re = re.compile("|".join(map(re.escape, self.mathematics_keywords)))
+
+    def classify_fast(self, query: str) -> Tuple[List[str], float, int]:
+        # Un único lowercased compartido entre clave de caché y barrido;
+        # el propio str es la clave: el hash ya se hace en C
+        query_lower = query.strip().lower()
+        cached = self.cache.get(query_lower)
+        if cached is not None:
+            self._cache_hits += 1
+            self.cache.move_to_end(query_lower)
+            return cached
+        self._cache_misses += 1
+
+        scores = np.zeros(len(self._domain_names), np.float32)
+        if self._automaton is not None:
+            for _, (domain_idx, weight) in self._automaton.iter(query_lower):
+                scores[domain_idx] += weight
+        else:
+            for match in self._keyword_re.finditer(query_lower):
+                domain_idx, weight = self._kw_payload[match.group()]
+                scores[domain_idx] += weight
+
+        # Heurísticas baratas que el autómata no cubre
+        if self._math_expr_re.search(query_lower):
+            scores[DOMAINS['mathematics']] += 0.8
+
+        threshold = 0.4
+        detected = np.where(scores >= threshold)[0]
+        if detected.size:
+            domains = [self._domain_names[i] for i in detected]
+            mask = 0
+            for i in detected:
+                mask |= 1 << int(i)
+        else:
+            # Sin señal clara: predicados de respaldo y por último 'language'
+            if self._is_mathematics_task(query_lower):
+                domains = ['mathematics']
+            elif self._is_programming_task(query_lower):
+                domains = ['programming']
+            else:
+                domains = ['language']
+            mask = 1 << DOMAINS[domains[0]]
+        complexity = self._calculate_complexity_fast(query_lower)
+        result = (domains, complexity, mask)
+        self.cache[query_lower] = result
+        if len(self.cache) > self.CACHE_MAX_ENTRIES:
+            self.cache.popitem(last=False)
+        return result
+
+    def _calculate_complexity_fast(self, query_lower: str) -> float:
+        # Recibe la consulta ya en minúsculas desde classify_fast
+        words = query_lower.split()
+        complexity = min(0.70, 0.15 + 0.02 * len(words))
+        if self._complex_kw_re.search(query_lower):
+            complexity += 0.15
+        if self._creation_kw_re.search(query_lower):
+            complexity += 0.10
+        if self._math_expr_re.search(query_lower):
+            complexity -= 0.05
+        return float(np.clip(complexity, 0.05, 0.95))
+
+    def _is_creative_task(self, query_lower: str) -> bool:
+        return bool(self._creative_re.search(query_lower))
+
+    def _is_language_task(self, query_lower: str) -> bool:
+        return bool(self._language_re.search(query_lower))
+
+    def _is_programming_task(self, query_lower: str) -> bool:
+        return bool(self._programming_re.search(query_lower))
+
+    def _is_mathematics_task(self, query_lower: str) -> bool:
+        return bool(self._mathematics_re.search(query_lower))
+
+    def get_cache_stats(self) -> Dict:
+        lookups = self._cache_hits + self._cache_misses
+        return {
+            'cached_queries': len(self.cache),
+            'hits': self._cache_hits,
+            'misses': self._cache_misses,
+            'hit_rate': self._cache_hits / lookups if lookups else 0.0,
+        }
+
+
+class _OllamaMicroBatcher:
+    """Agrupa peticiones concurrentes al mismo modelo en ventanas cortas.
+
+    Cada modelo tiene su cola; un drenador por modelo acumula hasta
+    BATCH_MAX peticiones o hasta agotar la ventana y las despacha juntas
+    con asyncio.gather, amortizando el arranque del modelo y la reserva
+    de KV sobre el lote.
+    """
+
+    BATCH_MAX = 8
+    BATCH_WINDOW_MS = 8
+
+    def __init__(self, system_prompts: Dict[str, str], deterministic: bool = False):
+        self._system_prompts = system_prompts
+        # temperature=0 cuando el sistema cachea respuestas: las entradas
+        # de la LRU deben ser reproducibles
+        self._options = {'temperature': 0} if deterministic else None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._drainers: Dict[str, asyncio.Task] = {}
+        self._client = ollama.AsyncClient() if OLLAMA_AVAILABLE else None
+
+    async def submit(self, model_id: str, query: str) -> str:
+        fut = asyncio.get_running_loop().create_future()
+        queue = self._queues.get(model_id)
+        if queue is None:
+            queue = self._queues[model_id] = asyncio.Queue()
+            self._drainers[model_id] = asyncio.ensure_future(
+                self._drain(model_id, queue)
+            )
+        queue.put_nowait((query, fut))
+        return await fut
+
+    async def _drain(self, model_id: str, queue: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        window = self.BATCH_WINDOW_MS / 1000.0
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + window
+            while len(batch) < self.BATCH_MAX:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            responses = await asyncio.gather(
+                *(self._chat(model_id, query) for query, _ in batch),
+                return_exceptions=True,
+            )
+            for (_, fut), response in zip(batch, responses):
+                if isinstance(response, BaseException):
+                    # El error se propaga al caller, que decide el fallback
+                    # (y así nunca se cachea una respuesta fallida)
+                    fut.set_exception(response)
+                else:
+                    fut.set_result(response)
+
+    async def _chat(self, model_id: str, query: str) -> str:
+        response = await self._client.chat(
+            model=model_id,
+            messages=[
+                {'role': 'system', 'content': self._system_prompts[model_id]},
+                {'role': 'user', 'content': query},
+            ],
+            keep_alive='30m',
+            options=self._options,
+        )
+        return response['message']['content']
+
+
+class AlphaHyperionSystem:
+    """Orquesta clasificador, enrutador, Monte Carlo y los modelos Ollama."""
+
+    # Umbral de coseno para considerar dos consultas equivalentes y modelo
+    # ligero de embeddings servido por el propio Ollama
+    SEMANTIC_THRESHOLD = 0.95
+    EMBED_MODEL = 'nomic-embed-text'
+    # Entradas máximas de la caché semántica por experto
+    SEMANTIC_CACHE_MAX = 512
+
+    def __init__(self, simulate_ollama_ms: float = 0.0,
+                 cache_llm_responses: bool = True):
+        # Latencia simulada del LLM; 0 = sin sleep (benchmarks/producción)
+        self._sim_ollama_ms = simulate_ollama_ms
+        self.experts_list = ExpertFactory.create_default_experts()
+        self.experts = {e.id: e for e in self.experts_list}
+        self.domain_mapping = ExpertFactory.get_domain_mapping()
+        self._domain_keys = tuple(self.domain_mapping.keys())
+        self._domain_values = tuple(self.domain_mapping.values())
+        # Atributos numéricos de los expertos en columnas contiguas (SoA);
+        # la puntuación de candidatos se hace sobre este array, no sobre
+        # los dataclasses.
+        self._exp_arr = np.array(
+            [[e.success_rate, e.specialization_score, e.availability,
+              e.fatigue, e.max_load_capacity, e.load] for e in self.experts_list],
+            dtype=np.float32,
+        )
+        self._id_to_idx = {e.id: i for i, e in enumerate(self.experts_list)}
+        # Fila del experto por defecto, resuelta una vez: el fallback de
+        # _get_relevant_experts no materializa la lista de claves
+        self._default_expert_id = next(iter(self.experts))
+        self._default_expert_idx = self._id_to_idx[self._default_expert_id]
+        self._domain_to_idx = {
+            domain: self._id_to_idx[expert_id]
+            for domain, expert_id in self.domain_mapping.items()
+        }
+        # Bit de dominio por experto y mapa bit -> fila para iterar máscaras
+        self._expert_domain_bit = np.array(
+            [1 << DOMAINS[e.domain] for e in self.experts_list], dtype=np.uint32
+        )
+        # Tupla indexada por el entero de dominio: fetch por índice en vez
+        # de hash de dict al resolver bits de la máscara
+        self._domain_idx_to_expert_idx = tuple(
+            self._domain_to_idx.get(domain) for domain in DOMAINS
+        )
+        self.classifier = FastPatternClassifier()
+        self.router = IntelligentRouter()
+        self.engine = MonteCarloEngine()
+        self.meta_agent = MetaAgent()
+        # Historial de enrutamiento como columnas preasignadas (SoA) en vez de
+        # un deque de dicts: get_statistics opera sobre memoria contigua.
+        self._hist_size = 500
+        self._hist_routing_ms = np.zeros(self._hist_size, np.float32)
+        self._hist_query_ms = np.zeros(self._hist_size, np.float32)
+        self._hist_total_ms = np.zeros(self._hist_size, np.float32)
+        self._hist_perf = np.zeros(self._hist_size, np.float32)
+        self._hist_is_multi = np.zeros(self._hist_size, np.bool_)
+        # Vista por nombre para _recent_history; mismas arrays, sin copia
+        self._hist = {
+            'routing_ms': self._hist_routing_ms,
+            'query_ms': self._hist_query_ms,
+            'total_ms': self._hist_total_ms,
+            'perf': self._hist_perf,
+            'is_multi': self._hist_is_multi,
+        }
+        self._hist_head = 0
+        self._hist_count = 0
+        # Par de contadores [total, éxitos] en un array int64: el ratio se
+        # calcula solo cuando se pide, no por petición
+        self._counters = np.zeros(2, dtype=np.int64)
+        self._next_id = 0
+        # Caché semántica de respuestas, particionada por experto para que
+        # un acierto nunca devuelva texto generado por otro modelo. Cada
+        # entrada es [matriz de embeddings, respuestas, cabeza]: la matriz
+        # crece por duplicación hasta SEMANTIC_CACHE_MAX filas y después
+        # sobrescribe en anillo, como el resto de cachés acotadas.
+        self._sem_cache: Dict[str, list] = {}
+        self._model_meta: Dict = {}
+        # Micro-batcher perezoso: se crea en el primer route_query_async,
+        # ya dentro del event loop que lo va a usar
+        self._batcher = None
+        # Cliente async perezoso para el camino de streaming
+        self._async_ollama = None
+        # Cliente síncrono persistente: la sesión HTTP mantiene viva la
+        # conexión TCP a localhost:11434 entre llamadas
+        self._ollama = ollama.Client(timeout=60.0) if OLLAMA_AVAILABLE else None
+        # L1 exacto delante de la caché semántica: consultas repetidas
+        # byte a byte (health-checks, reintentos de UI) salen en O(1).
+        # Solo es correcto con generación determinista, así que activa
+        # temperature=0 en las llamadas al chat.
+        self._llm_cache = LRUCache(maxsize=1024) if cache_llm_responses else None
+        # Prompt de sistema fijo por experto. Debe ser byte-idéntico entre
+        # llamadas: la caché de prefijos de Ollama reutiliza el KV del
+        # prefijo compartido solo si los tokens coinciden exactamente.
+        self._system_prompts = {
+            'mathstral:7b': ("Eres un experto en matemáticas. Responde con "
+                             "precisión y muestra el razonamiento."),
+            'codegemma:2b': ("Eres un experto en programación. Responde con "
+                             "código claro y correcto."),
+            'gemma2:2b': ("Eres un experto en lenguaje y redacción. Responde "
+                          "con claridad y buen estilo."),
+        }
+        if OLLAMA_AVAILABLE:
+            self._preload_models()
+
+    def route_query(self, query: str) -> Dict:
+        return self._route_one(query, self.classifier.classify_fast(query),
+                               use_llm=True)
+
+    def route_queries_batch(self, queries: List[str]) -> List[Dict]:
+        """Enruta un lote sin pasar por el LLM (benchmarks y suites de prueba).
+
+        La clasificación se hace primero para todo el lote (una pasada del
+        autómata por consulta, con la LRU absorbiendo repeticiones) y la
+        caché del motor Monte Carlo colapsa las combinaciones repetidas de
+        equipo y complejidad, de modo que el coste Python se amortiza sobre
+        el lote completo.
+        """
+        classified = [self.classifier.classify_fast(q) for q in queries]
+        return [
+            self._route_one(query, classification, use_llm=False)
+            for query, classification in zip(queries, classified)
+        ]
+
+    def _route_prepare(self, query: str,
+                       classification: Tuple[List[str], float, int]):
+        """Fase síncrona previa al LLM: tarea, selección y simulación."""
+        start = time.perf_counter()
+        domains, complexity, domains_mask = classification
+        # Contador monótono: sin syscall ni f-string por consulta
+        self._next_id += 1
+        interdependency, task_scope = _task_params(complexity, len(domains))
+        task = Task(
+            id=self._next_id,
+            query=query,
+            complexity=complexity,
+            required_domains=domains,
+            domains_mask=domains_mask,
+            interdependency=interdependency,
+            task_scope=task_scope,
+        )
+        selected_idx = self._get_relevant_experts(task)
+        selected_experts = [self.experts_list[i] for i in selected_idx]
+
+        # Las filas SoA ya están calculadas: el motor no toca atributos Python
+        selected_rows = self._exp_arr[selected_idx]
+        simulation = self.engine.simulate_collaboration(
+            selected_experts, task, exp_rows=selected_rows
+        )
+        self.meta_agent.observe(selected_experts, task, simulation)
+        routing_ms = (time.perf_counter() - start) * 1000
+        return task, selected_idx, selected_experts, simulation, routing_ms
+
+    def _route_one(self, query: str, classification: Tuple[List[str], float, int],
+                   use_llm: bool) -> Dict:
+        task, selected_idx, selected_experts, simulation, routing_ms = (
+            self._route_prepare(query, classification)
+        )
+        primary_id = selected_experts[0].id
+        if use_llm and OLLAMA_AVAILABLE:
+            # L1: repetición byte a byte, antes de pagar el embedding
+            exact = self._exact_cache_get(primary_id, query)
+            if exact is not None:
+                response_text, query_ms = exact, 0.0
+            else:
+                # L2 semántica: una consulta casi idéntica ya respondida
+                # evita por completo el forward del LLM
+                emb = self._embed_query(query)
+                cached = self._semantic_lookup(emb, primary_id)
+                if cached is not None:
+                    response_text, query_ms = cached, 0.0
+                else:
+                    llm_start = time.perf_counter()
+                    try:
+                        response_text, query_ms = self._query_ollama(primary_id,
+                                                                     query)
+                        # Solo las respuestas reales entran en la caché
+                        self._semantic_store(emb, response_text, primary_id)
+                    except Exception as e:
+                        response_text = f"[Ollama no disponible: {e}]"
+                        query_ms = (time.perf_counter() - llm_start) * 1000
+        else:
+            if self._sim_ollama_ms > 0:
+                time.sleep(self._sim_ollama_ms / 1000.0)
+            response_text, query_ms = f"[simulado:{primary_id}]", self._sim_ollama_ms
+        return self._route_finish(task, selected_idx, selected_experts,
+                                  simulation, routing_ms, response_text, query_ms)
+
+    async def route_query_async(self, query: str) -> Dict:
+        """Variante async de route_query: el LLM pasa por el micro-batcher.
+
+        La fase de enrutamiento (clasificación + Monte Carlo) sigue siendo
+        síncrona y de microsegundos; solo la llamada a Ollama cede el event
+        loop, de modo que las peticiones concurrentes al mismo modelo se
+        agrupan en la ventana del batcher.
+        """
+        classification = self.classifier.classify_fast(query)
+        task, selected_idx, selected_experts, simulation, routing_ms = (
+            self._route_prepare(query, classification)
+        )
+        primary_id = selected_experts[0].id
+        if OLLAMA_AVAILABLE:
+            # Mismas capas que el camino síncrono: L1 exacta y después la
+            # semántica; el embedding es una llamada HTTP bloqueante, así
+            # que va a un thread para no retener el event loop
+            exact = self._exact_cache_get(primary_id, query)
+            if exact is not None:
+                response_text, query_ms = exact, 0.0
+            else:
+                emb = await asyncio.to_thread(self._embed_query, query)
+                cached = self._semantic_lookup(emb, primary_id)
+                if cached is not None:
+                    response_text, query_ms = cached, 0.0
+                else:
+                    llm_start = time.perf_counter()
+                    try:
+                        response_text, query_ms = await self._query_ollama_async(
+                            primary_id, query)
+                        # Solo las respuestas reales entran en la caché
+                        self._semantic_store(emb, response_text, primary_id)
+                    except Exception as e:
+                        response_text = f"[Ollama no disponible: {e}]"
+                        query_ms = (time.perf_counter() - llm_start) * 1000
+        else:
+            if self._sim_ollama_ms > 0:
+                await asyncio.sleep(self._sim_ollama_ms / 1000.0)
+            response_text, query_ms = f"[simulado:{primary_id}]", self._sim_ollama_ms
+        return self._route_finish(task, selected_idx, selected_experts,
+                                  simulation, routing_ms, response_text, query_ms)
+
+    def _route_finish(self, task: Task, selected_idx: List[int],
+                      selected_experts: List, simulation: Dict,
+                      routing_ms: float, response_text: str,
+                      query_ms: float) -> Dict:
+        for row, expert in zip(selected_idx, selected_experts):
+            expert.update_performance(simulation['mean_performance'], task.complexity)
+            self._sync_expert_row(row, expert)
+        self.router.update_performance_memory(task, simulation['mean_performance'])
+
+        success = self._is_routing_successful(task, selected_idx)
+        self._counters[0] += 1
+        self._counters[1] += success
+
+        result = {
+            'task_id': task.id,
+            'query': task.query,
+            'domains': task.required_domains,
+            'complexity': round(task.complexity, 3),
+            'experts': [e.id for e in selected_experts],
+            'response': response_text,
+            'expected_performance': simulation['mean_performance'],
+            'success_probability': simulation['success_probability'],
+            'routing_reason': self._generate_routing_reason(task, selected_experts),
+            'routing_time_ms': routing_ms,
+            'query_time_ms': query_ms,
+            'total_time_ms': routing_ms + query_ms,
+            'multi_expert': len(selected_experts) > 1,
+        }
+        self._record_routing(result)
+        return result
+
+    def _record_routing(self, result: Dict):
+        # Solo se almacenan los escalares; el dict completo es para el caller
+        pos = self._hist_head % self._hist_size
+        self._hist_routing_ms[pos] = result['routing_time_ms']
+        self._hist_query_ms[pos] = result['query_time_ms']
+        self._hist_total_ms[pos] = result['total_time_ms']
+        self._hist_perf[pos] = result['expected_performance']
+        self._hist_is_multi[pos] = result['multi_expert']
+        self._hist_head += 1
+        self._hist_count = min(self._hist_count + 1, self._hist_size)
+
+    def _sync_expert_row(self, row: int, expert) -> None:
+        # Mantiene las columnas SoA alineadas con el estado mutable del experto
+        self._exp_arr[row, 0] = expert.success_rate
+        self._exp_arr[row, 2] = expert.availability
+        self._exp_arr[row, 3] = expert.fatigue
+
+    def _get_relevant_experts(self, task: Task) -> List[int]:
+        """Devuelve índices en experts_list ordenados por puntuación."""
+        # Itera los bits activos de la máscara: sin hashing de strings
+        candidate_idx = []
+        mask = task.domains_mask
+        lookup = self._domain_idx_to_expert_idx
+        n_domains = len(lookup)
+        while mask:
+            bit = mask & -mask
+            mask ^= bit
+            domain_idx = bit.bit_length() - 1
+            if domain_idx < n_domains:
+                idx = lookup[domain_idx]
+                if idx is not None:
+                    candidate_idx.append(idx)
+        if not candidate_idx:
+            return [self._default_expert_idx]
+        idx_arr = np.asarray(candidate_idx, dtype=np.int64)
+        scores = _score_experts(self._exp_arr, idx_arr)
+        order = np.argsort(-scores)
+        return [int(i) for i in idx_arr[order]]
+
+    def _generate_routing_reason(self, task: Task, experts: List) -> str:
+        return _routing_reason(tuple(task.required_domains), len(experts),
+                               int(task.complexity * 20))
+
+    def _is_routing_successful(self, task: Task, selected_idx: List[int]) -> bool:
+        if not task.domains_mask:
+            return True
+        return bool(self._expert_domain_bit[selected_idx[0]] & task.domains_mask)
+
+    def _embed_query(self, query: str):
+        """Embedding L2-normalizado de la consulta, o None si no hay servicio."""
+        if not OLLAMA_AVAILABLE:
+            return None
+        try:
+            raw = ollama.embeddings(model=self.EMBED_MODEL, prompt=query)
+            emb = np.asarray(raw['embedding'], dtype=np.float32)
+        except Exception:
+            return None
+        norm = float(np.linalg.norm(emb))
+        if norm == 0.0:
+            return None
+        return emb / norm
+
+    def _semantic_lookup(self, emb, expert_id: str):
+        """Respuesta previa del mismo experto con coseno >= umbral, o None."""
+        entry = self._sem_cache.get(expert_id) if emb is not None else None
+        if entry is None:
+            return None
+        mat, responses, _ = entry
+        # Coseno contra las entradas de este experto en un producto
+        # matriz-vector
+        sims = mat[:len(responses)] @ emb
+        best = int(np.argmax(sims))
+        if sims[best] >= self.SEMANTIC_THRESHOLD:
+            return responses[best]
+        return None
+
+    def _semantic_store(self, emb, response_text: str, expert_id: str):
+        if emb is None:
+            return
+        entry = self._sem_cache.get(expert_id)
+        if entry is None:
+            mat = np.empty((64, emb.shape[0]), dtype=np.float32)
+            entry = self._sem_cache[expert_id] = [mat, [], 0]
+        mat, responses, head = entry
+        pos = head % self.SEMANTIC_CACHE_MAX
+        if pos == mat.shape[0] and mat.shape[0] < self.SEMANTIC_CACHE_MAX:
+            # Crecimiento por duplicación hasta el tope; después la cabeza
+            # envuelve y se sobrescribe la entrada más antigua
+            grown = np.empty((min(mat.shape[0] * 2, self.SEMANTIC_CACHE_MAX),
+                              emb.shape[0]), dtype=np.float32)
+            grown[:mat.shape[0]] = mat
+            mat = entry[0] = grown
+        mat[pos] = emb
+        if pos == len(responses):
+            responses.append(response_text)
+        else:
+            responses[pos] = response_text
+        entry[2] = head + 1
+
+    def _exact_cache_get(self, model_id: str, query: str):
+        """Acierto L1 por (modelo, consulta) idénticos, o None."""
+        if self._llm_cache is None:
+            return None
+        return self._llm_cache.get((model_id, query))
+
+    async def _query_ollama_async(self, model_id: str, query: str) -> Tuple[str, float]:
+        """Chat vía micro-batcher con L1 exacta; propaga la excepción si falla."""
+        cached = self._exact_cache_get(model_id, query)
+        if cached is not None:
+            return cached, 0.0
+        start = time.perf_counter()
+        if self._batcher is None:
+            self._batcher = _OllamaMicroBatcher(
+                self._system_prompts,
+                deterministic=self._llm_cache is not None,
+            )
+        text = await self._batcher.submit(model_id, query)
+        if self._llm_cache is not None:
+            self._llm_cache[(model_id, query)] = text
+        return text, (time.perf_counter() - start) * 1000
+
+    async def _query_ollama_stream(self, model_id: str, query: str):
+        """Genera la respuesta trozo a trozo con stream=True."""
+        if self._async_ollama is None:
+            self._async_ollama = ollama.AsyncClient()
+        stream = await self._async_ollama.chat(
+            model=model_id,
+            messages=[
+                {'role': 'system', 'content': self._system_prompts[model_id]},
+                {'role': 'user', 'content': query},
+            ],
+            keep_alive='30m',
+            stream=True,
+        )
+        async for chunk in stream:
+            yield chunk['message']['content']
+
+    async def route_query_stream(self, query: str):
+        """Enruta y emite la respuesta del experto principal en streaming.
+
+        El primer trozo llega en el tiempo del primer token en vez de la
+        generación completa; la contabilidad (_route_finish) se hace al
+        agotar el stream con la respuesta reconstruida.
+
+        Este camino no consulta las cachés de respuestas a propósito: su
+        contrato es latencia al primer token, y un acierto devolvería el
+        texto completo de golpe en lugar de un stream.
+        """
+        classification = self.classifier.classify_fast(query)
+        task, selected_idx, selected_experts, simulation, routing_ms = (
+            self._route_prepare(query, classification)
+        )
+        primary_id = selected_experts[0].id
+        start = time.perf_counter()
+        pieces = []
+        if OLLAMA_AVAILABLE:
+            try:
+                async for piece in self._query_ollama_stream(primary_id, query):
+                    pieces.append(piece)
+                    yield piece
+            except Exception as e:
+                fallback = f"[Ollama no disponible: {e}]"
+                pieces.append(fallback)
+                yield fallback
+        else:
+            if self._sim_ollama_ms > 0:
+                await asyncio.sleep(self._sim_ollama_ms / 1000.0)
+            text = f"[simulado:{primary_id}]"
+            pieces.append(text)
+            yield text
+        query_ms = (time.perf_counter() - start) * 1000
+        self._route_finish(task, selected_idx, selected_experts, simulation,
+                           routing_ms, "".join(pieces), query_ms)
+
+    def _query_ollama(self, model_id: str, query: str) -> Tuple[str, float]:
+        """Chat síncrono con L1 exacta; propaga la excepción si falla.
+
+        El caller decide el texto de fallback: así ningún nivel de caché
+        puede quedarse con una respuesta de error.
+        """
+        cached = self._exact_cache_get(model_id, query)
+        if cached is not None:
+            return cached, 0.0
+        start = time.perf_counter()
+        options = {'temperature': 0} if self._llm_cache is not None else None
+        # Prefijo de sistema estable + keep_alive largo: Ollama mantiene
+        # modelo y KV del prefijo en memoria entre llamadas
+        response = self._ollama.chat(
+            model=model_id,
+            messages=[
+                {'role': 'system', 'content': self._system_prompts[model_id]},
+                {'role': 'user', 'content': query},
+            ],
+            keep_alive='30m',
+            options=options,
+        )
+        text = response['message']['content']
+        if self._llm_cache is not None:
+            self._llm_cache[(model_id, query)] = text
+        return text, (time.perf_counter() - start) * 1000
+
+    # Metadatos de modelos cacheados entre arranques: evita el round-trip
+    # HTTP de show() en cada boot
+    _MODEL_CACHE_PATH = Path.home() / '.cache' / 'hyperion' / 'models.pkl'
+
+    def _preload_models(self):
+        # Calienta los kernels JIT escalares fuera del primer query
+        _update_perf_jit(0.80, 0.0, 10.0, 0.80, 0.5)
+        _task_params(0.5, 2)
+        try:
+            with open(self._MODEL_CACHE_PATH, 'rb') as fh:
+                cached = pickle.load(fh)
+            if set(cached) >= set(self.experts):
+                self._model_meta = cached
+                return
+        except (OSError, pickle.PickleError, EOFError):
+            pass
+        try:
+            asyncio.run(self._preload_models_async())
+        except RuntimeError:
+            # Ya hay un event loop activo; el precalentamiento no es crítico
+            pass
+
+    async def _preload_models_async(self):
+        # Todos los show() en vuelo a la vez: el arranque cuesta el máximo
+        # de las latencias, no la suma
+        client = ollama.AsyncClient()
+        results = await asyncio.gather(
+            *(client.show(expert_id) for expert_id in self.experts),
+            return_exceptions=True,
+        )
+        meta = {
+            expert_id: result
+            for expert_id, result in zip(self.experts, results)
+            if not isinstance(result, BaseException)
+        }
+        self._model_meta = meta
+        if len(meta) == len(self.experts):
+            try:
+                self._MODEL_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+                with open(self._MODEL_CACHE_PATH, 'wb') as fh:
+                    pickle.dump(meta, fh)
+            except OSError:
+                pass
+
+    @property
+    def total_queries(self) -> int:
+        return int(self._counters[0])
+
+    @property
+    def successful_routings(self) -> int:
+        return int(self._counters[1])
+
+    def get_success_rate(self) -> float:
+        total = self._counters[0]
+        if total == 0:
+            return 100.0
+        return float(self._counters[1] / total * 100)
+
+    def _recent_history(self, column: str, n: int) -> np.ndarray:
+        # Vista contigua de las últimas n entradas; solo copia si el rango
+        # envuelve el final del buffer circular.
+        arr = self._hist[column]
+        start = (self._hist_head - n) % self._hist_size
+        end = start + n
+        if end <= self._hist_size:
+            return arr[start:end]
+        return np.concatenate((arr[start:], arr[:end - self._hist_size]))
+
+    def get_statistics(self) -> Dict:
+        n = min(50, self._hist_count)
+        if n == 0:
+            return {'total_queries': 0}
+        stats = {
+            'total_queries': self.total_queries,
+            'success_rate': self.get_success_rate(),
+            'avg_routing_time_ms': float(self._recent_history('routing_ms', n).mean()),
+            'avg_query_time_ms': float(self._recent_history('query_ms', n).mean()),
+            'avg_total_time_ms': float(self._recent_history('total_ms', n).mean()),
+            'avg_expected_performance': float(self._recent_history('perf', n).mean()),
+            'multi_expert_rate': float(self._recent_history('is_multi', n).mean()),
+            'cache': self.classifier.get_cache_stats(),
+            'meta_agent': self.meta_agent.get_statistics(),
+        }
+        # Las columnas SoA ya reflejan el estado de los expertos
+        # (_sync_expert_row): media directa sobre memoria contigua
+        stats['experts'] = {
+            'avg_fatigue': float(self._exp_arr[:, 3].mean()),
+            'avg_success_rate': float(self._exp_arr[:, 0].mean()),
+            'avg_availability': float(self._exp_arr[:, 2].mean()),
+        }
+        return stats
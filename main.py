@@ -0,0 +1,59 @@
+"""Demo local del enrutador Alpha Hyperion con consultas de prueba."""
+
+import time
+
+from hyperion.core_system import AlphaHyperionSystem
+
+TEST_QUERIES = [
+    "¿Cuánto es 2+2?",
+    "Calcula la derivada de x^2 + 3x",
+    "Escribe una función en Python que ordene una lista",
+    "Redacta un poema corto sobre el mar",
+    "Explica qué es un algoritmo y da un ejemplo en código",
+    "Traduce 'good morning' al español",
+    "Resuelve la ecuación 3x + 5 = 20",
+    "Crea un script que calcule números primos",
+]
+
+
+def collect_test_results(system: AlphaHyperionSystem, queries=TEST_QUERIES):
+    """Solo enruta y acumula; nada de I/O dentro del bucle medido."""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        results.append(system.route_query(query))
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    return results, elapsed_ms
+
+
+def format_test_results(results, elapsed_ms: float):
+    for result in results:
+        print(f"\nConsulta: {result['query']}")
+        print(f"  Dominios: {', '.join(result['domains'])} "
+              f"(complejidad {result['complexity']:.2f})")
+        print(f"  Expertos: {', '.join(result['experts'])}")
+        print(f"  Razón: {result['routing_reason']}")
+        print(f"  Rendimiento esperado: {result['expected_performance']:.2f} "
+              f"(p. éxito {result['success_probability']:.2f})")
+        print(f"  Tiempos: routing {result['routing_time_ms']:.2f} ms, "
+              f"total {result['total_time_ms']:.2f} ms")
+    print(f"\n{len(results)} consultas en {elapsed_ms:.1f} ms")
+
+
+def run_test_queries(system: AlphaHyperionSystem, queries=TEST_QUERIES):
+    results, elapsed_ms = collect_test_results(system, queries)
+    format_test_results(results, elapsed_ms)
+
+
+def print_statistics(system: AlphaHyperionSystem):
+    stats = system.get_statistics()
+    print("\n=== Estadísticas del sistema ===")
+    for key, value in stats.items():
+        print(f"  {key}: {value}")
+
+
+if __name__ == "__main__":
+    print("Alpha Hyperion — demo de enrutamiento")
+    system = AlphaHyperionSystem(simulate_ollama_ms=1.0)
+    run_test_queries(system)
+    print_statistics(system)